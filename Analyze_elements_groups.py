@@ -1,169 +1,166 @@
+import contextlib
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
 import numpy as np
 from scipy import stats
-import matplotlib.pyplot as plt
-import matplotlib
 
-# フォント設定
-matplotlib.rcParams['font.sans-serif'] = ['Arial Unicode MS', 'DejaVu Sans']
-matplotlib.rcParams['axes.unicode_minus'] = False
+from common import (load_data, calc_eta_squared, shapiro_batch, levene_batch,
+                    ASYMPTOTIC_MIN_N, JUDGMENT_CODES, MISSING_CODE)
 
-print("=" * 80)
-print("3要素の群別分析")
-print("=" * 80)
 
-# データ読み込み
-df = pd.read_csv('element_judgment_29participants_complete.csv')
+# サマリーテーブルの列 (各要素の結果はこの順のタプルで返す)
+SUMMARY_COLUMNS = ['Element', 'n_groups', 'group_names', 'p_value', 'significance', 'effect_size']
 
-# 要素リスト
-elements = [
-    ('Element1_Obligation', '要素1: コミュニケーション続行義務意識'),
-    ('Element2_Burden', '要素2: 対人配慮負担'),
-    ('Element3_Rejection', '要素3: 拒絶・評価懸念')
-]
+# 箱ひげ図用の Figure (プロセスごとに1つ作って使い回す)
+_figure = None
+
+
+def _get_figure():
+    """箱ひげ図用の Figure と Axes を返す (初回のみ作成し、以降は Axes を消去して再利用)"""
+    global _figure
+    if _figure is None:
+        # matplotlib は図を描く処理でのみ読み込む (ファイル出力のみのため Agg)
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+
+        # フォント設定
+        matplotlib.rcParams['font.sans-serif'] = ['Arial Unicode MS', 'DejaVu Sans']
+        matplotlib.rcParams['axes.unicode_minus'] = False
+
+        _figure = plt.subplots(figsize=(10, 7), constrained_layout=True)
+
+    fig, ax = _figure
+    ax.cla()
+    return fig, ax
 
-# 出力フォルダ作成
-import os
-os.makedirs('element_analysis', exist_ok=True)
 
-results_summary = []
+def _close_figure():
+    """_get_figure() で作った Figure を閉じる"""
+    global _figure
+    if _figure is not None:
+        import matplotlib.pyplot as plt
+        plt.close(_figure[0])
+        _figure = None
+
+
+def _analyze_element(col, name, group_names, groups_data, shapiro_res, levene_res, delta, codes):
+    """1要素分の群別比較を行い、結果を表示して箱ひげ図を保存する
+
+    shapiro_res: {群名: (W, p)}、levene_res: (F, p) または None (いずれも計算済みの結果)
+    返り値はサマリー1行分のタプル (SUMMARY_COLUMNS の順、群が2つ未満なら None)。
+    """
+    summary = None
 
-for col, name in elements:
     print(f"\n{'='*80}")
     print(f"{name}")
     print(f"{'='*80}")
-    
-    # データ不足を除外
-    df_analysis = df[df[col] != 'データ不足'].copy()
-    
+
+    # データ不足・判定の欠損 (コード -1) を除外した群分け
+    keep = (codes >= 0) & (codes != MISSING_CODE)
+
     # 群別の統計
     print("\n【記述統計】")
-    for group in ['有効', '不変', '逆効果']:
-        subset = df_analysis[df_analysis[col] == group]
-        if len(subset) > 0:
-            mean_delta = subset['Delta_STAI'].mean()
-            sd_delta = subset['Delta_STAI'].std()
-            median_delta = subset['Delta_STAI'].median()
-            min_delta = subset['Delta_STAI'].min()
-            max_delta = subset['Delta_STAI'].max()
-            
-            print(f"\n{group}群 (n={len(subset)}):")
-            print(f"  平均ΔSTAI-S: {mean_delta:+.2f}")
-            print(f"  SD: {sd_delta:.2f}")
-            print(f"  中央値: {median_delta:+.2f}")
-            print(f"  範囲: {min_delta:+.0f} ~ {max_delta:+.0f}")
-    
+    for group, data in zip(group_names, groups_data):
+        mean_delta = data.mean()
+        sd_delta = data.std(ddof=1) if len(data) > 1 else np.nan
+        median_delta = np.median(data)
+        min_delta = data.min()
+        max_delta = data.max()
+
+        print(f"\n{group}群 (n={len(data)}):")
+        print(f"  平均ΔSTAI-S: {mean_delta:+.2f}")
+        print(f"  SD: {sd_delta:.2f}")
+        print(f"  中央値: {median_delta:+.2f}")
+        print(f"  範囲: {min_delta:+.0f} ~ {max_delta:+.0f}")
+
     # 群間比較(データ不足を除外)
-    groups_data = []
-    group_names = []
-    
-    for group in ['有効', '不変', '逆効果']:
-        subset = df_analysis[df_analysis[col] == group]
-        if len(subset) > 0:
-            groups_data.append(subset['Delta_STAI'].values)
-            group_names.append(group)
-    
     if len(groups_data) >= 2:
         print("\n【群間比較】")
-        
+
         # 正規性検定
         print("\n正規性検定 (Shapiro-Wilk):")
         all_normal = True
         for i, (data, gname) in enumerate(zip(groups_data, group_names)):
             if len(data) >= 3:
-                w, p = stats.shapiro(data)
-                print(f"  {gname}群: W={w:.4f}, p={p:.4f}", end="")
+                w, p = shapiro_res[gname]
                 if p < 0.05:
-                    print(" (非正規)")
                     all_normal = False
-                else:
-                    print(" (正規)")
+                print(f"  {gname}群: W={w:.4f}, p={p:.4f} {'(非正規)' if p < 0.05 else '(正規)'}")
             else:
                 print(f"  {gname}群: n<3のためスキップ")
                 all_normal = False
-        
+
         # 等分散性検定
-        if len(groups_data) >= 2 and all(len(g) >= 2 for g in groups_data):
-            stat, p_levene = stats.levene(*groups_data)
-            print(f"\n等分散性検定 (Levene): F={stat:.4f}, p={p_levene:.4f}", end="")
-            if p_levene < 0.05:
-                print(" (等分散性なし)")
-            else:
-                print(" (等分散性あり)")
-        
+        if levene_res is not None:
+            stat, p_levene = levene_res
+            levene_mark = '(等分散性なし)' if p_levene < 0.05 else '(等分散性あり)'
+            print(f"\n等分散性検定 (Levene): F={stat:.4f}, p={p_levene:.4f} {levene_mark}")
+
         # 群間検定
         if len(groups_data) == 2:
             # 2群の場合: t検定 or Mann-Whitney U検定
             if all_normal:
                 t_stat, p_value = stats.ttest_ind(groups_data[0], groups_data[1])
-                print(f"\n対応なしt検定: t={t_stat:.3f}, p={p_value:.4f}", end="")
+                test_line = f"対応なしt検定: t={t_stat:.3f}, p={p_value:.4f}"
             else:
-                u_stat, p_value = stats.mannwhitneyu(groups_data[0], groups_data[1])
-                print(f"\nMann-Whitney U検定: U={u_stat:.3f}, p={p_value:.4f}", end="")
-        
+                large_n = min(len(groups_data[0]), len(groups_data[1])) >= ASYMPTOTIC_MIN_N
+                u_stat, p_value = stats.mannwhitneyu(groups_data[0], groups_data[1],
+                                                     alternative='two-sided',
+                                                     method='asymptotic' if large_n else 'auto')
+                test_line = f"Mann-Whitney U検定: U={u_stat:.3f}, p={p_value:.4f}"
+
         elif len(groups_data) >= 3:
             # 3群の場合: ANOVA or Kruskal-Wallis検定
             if all_normal:
                 f_stat, p_value = stats.f_oneway(*groups_data)
-                print(f"\n一元配置分散分析 (ANOVA): F={f_stat:.3f}, p={p_value:.4f}", end="")
+                test_line = f"一元配置分散分析 (ANOVA): F={f_stat:.3f}, p={p_value:.4f}"
             else:
                 h_stat, p_value = stats.kruskal(*groups_data)
-                print(f"\nKruskal-Wallis検定: H={h_stat:.3f}, p={p_value:.4f}", end="")
-        
+                test_line = f"Kruskal-Wallis検定: H={h_stat:.3f}, p={p_value:.4f}"
+
         # 有意性判定
         if p_value < 0.001:
-            print(" ***")
             sig = "***"
         elif p_value < 0.01:
-            print(" **")
             sig = "**"
         elif p_value < 0.05:
-            print(" *")
             sig = "*"
         else:
-            print(" (n.s.)")
             sig = "n.s."
-        
+
+        print(f"\n{test_line} {sig if sig != 'n.s.' else '(n.s.)'}")
+
         # 効果量 (η² or ε²)
         if len(groups_data) >= 2:
-            # 全データを1つの配列に
-            all_data = np.concatenate(groups_data)
-            # 群ラベルを作成
-            group_labels = np.concatenate([np.full(len(g), i) for i, g in enumerate(groups_data)])
-            
             # η² (eta squared) を計算
-            ss_between = sum([len(g) * (np.mean(g) - np.mean(all_data))**2 for g in groups_data])
-            ss_total = np.sum((all_data - np.mean(all_data))**2)
-            eta_squared = ss_between / ss_total if ss_total > 0 else 0
-            
-            print(f"効果量 (η²): {eta_squared:.3f}", end="")
+            eta_squared = calc_eta_squared(delta[keep], codes[keep])
+
             if eta_squared >= 0.14:
-                print(" (大)")
+                eta_label = "大"
             elif eta_squared >= 0.06:
-                print(" (中)")
+                eta_label = "中"
             elif eta_squared >= 0.01:
-                print(" (小)")
+                eta_label = "小"
             else:
-                print(" (極小)")
-        
+                eta_label = "極小"
+            print(f"効果量 (η²): {eta_squared:.3f} ({eta_label})")
+
         # 結果を保存
-        results_summary.append({
-            'Element': name,
-            'n_groups': len(groups_data),
-            'group_names': ', '.join(group_names),
-            'p_value': p_value,
-            'significance': sig,
-            'effect_size': eta_squared if len(groups_data) >= 2 else np.nan
-        })
-    
+        summary = (name, len(groups_data), ', '.join(group_names), p_value, sig,
+                   eta_squared if len(groups_data) >= 2 else np.nan)
+
     # ===================================
     # 可視化: 箱ひげ図
     # ===================================
     if len(groups_data) >= 2:
-        fig, ax = plt.subplots(figsize=(10, 7))
-        
+        fig, ax = _get_figure()
+
         positions = list(range(1, len(groups_data) + 1))
-        
+
         bp = ax.boxplot(groups_data, positions=positions, widths=0.6,
                         patch_artist=True, showmeans=True,
                         meanprops=dict(marker='D', markerfacecolor='red', 
@@ -172,24 +169,26 @@ for col, name in elements:
                         boxprops=dict(linewidth=2),
                         whiskerprops=dict(linewidth=2),
                         capprops=dict(linewidth=2))
-        
+
         # 色設定
         colors = {'有効': '#2E86AB', '不変': '#A8DADC', '逆効果': '#F18F01'}
         for patch, gname in zip(bp['boxes'], group_names):
             patch.set_facecolor(colors.get(gname, 'gray'))
             patch.set_alpha(0.7)
-        
-        # 個別データポイント
-        for i, (data, gname) in enumerate(zip(groups_data, group_names)):
-            y = data
-            x = np.random.normal(positions[i], 0.04, size=len(y))
-            ax.scatter(x, y, alpha=0.5, s=80, c=colors.get(gname, 'gray'), 
-                      edgecolors='black', linewidth=1)
-        
+
+        # 個別データポイント (全群をまとめて1回で描画)
+        x_all = np.concatenate([np.random.normal(pos, 0.04, size=len(d))
+                                for pos, d in zip(positions, groups_data)])
+        y_all = np.concatenate(groups_data)
+        c_all = np.concatenate([np.full(len(d), colors.get(g, 'gray'))
+                                for d, g in zip(groups_data, group_names)])
+        ax.scatter(x_all, y_all, alpha=0.5, s=80, c=c_all,
+                  edgecolors='black', linewidth=1)
+
         # 0のライン
         ax.axhline(y=0, color='red', linestyle='--', linewidth=2, alpha=0.5, 
                   label='変化なし (ΔSTAI-S=0)')
-        
+
         ax.set_xticks(positions)
         ax.set_xticklabels([f'{g}\n(n={len(d)})' for g, d in zip(group_names, groups_data)], 
                           fontsize=12, fontweight='bold')
@@ -197,48 +196,143 @@ for col, name in elements:
         ax.set_title(f'{name}\n群別ΔSTAI-S比較', fontsize=16, fontweight='bold', pad=20)
         ax.legend(fontsize=11)
         ax.grid(axis='y', alpha=0.3)
-        
+
         # 統計情報を追加
         if len(groups_data) == 2:
             test_name = "t検定" if all_normal else "Mann-Whitney"
         else:
             test_name = "ANOVA" if all_normal else "Kruskal-Wallis"
-        
+
         ax.text(0.02, 0.98, 
                f'{test_name}: p={p_value:.4f} {sig}\nη²={eta_squared:.3f}',
                transform=ax.transAxes, fontsize=11, verticalalignment='top',
                bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5))
-        
-        plt.tight_layout()
-        
+
         # ファイル名を作成
         element_num = col.replace('Element', '').replace('_Obligation', '').replace('_Burden', '').replace('_Rejection', '')
         filename = f'element_analysis/element{element_num}_group_comparison.png'
-        plt.savefig(filename, dpi=300, bbox_inches='tight')
-        plt.close()
-        
+        fig.savefig(filename, dpi=300)
+
         print(f"\n✓ 図を保存: {filename}")
 
-# ===================================
-# サマリーテーブル作成
-# ===================================
-print("\n" + "=" * 80)
-print("分析結果サマリー")
-print("=" * 80)
-
-summary_df = pd.DataFrame(results_summary)
-print("\n", summary_df.to_string(index=False))
-
-# CSV保存
-summary_df.to_csv('element_analysis/analysis_summary.csv', index=False, encoding='utf-8-sig')
-print("\n✓ サマリーをCSVで保存: element_analysis/analysis_summary.csv")
-
-print("\n" + "=" * 80)
-print("✅ 分析完了!")
-print("=" * 80)
-print("\n保存先: element_analysis/ フォルダ")
-print("  - element1_group_comparison.png")
-print("  - element2_group_comparison.png")
-print("  - element3_group_comparison.png")
-print("  - analysis_summary.csv")
-print("=" * 80)
\ No newline at end of file
+    return summary
+
+
+def analyze_one(col, name, group_names, groups_data, shapiro_res, levene_res, delta, codes):
+    """_analyze_element() を実行し、表示内容を文字列として返す
+
+    別プロセスで実行しても表示順が崩れないよう、出力はまとめて呼び出し元で表示する。
+    返り値は (表示内容, サマリー1行分のタプルまたは None)。
+    """
+    report = io.StringIO()
+    with contextlib.redirect_stdout(report):
+        summary = _analyze_element(col, name, group_names, groups_data,
+                                   shapiro_res, levene_res, delta, codes)
+    return report.getvalue(), summary
+
+
+def analyze_elements_groups(df, max_workers=None):
+    """3要素それぞれについて判定群別にΔSTAI-Sを比較し、図とサマリーを保存する
+
+    max_workers: 要素ごとの分析を並列に実行するプロセス数 (1 なら同じプロセスで順に実行)
+                 省略時は要素数と CPU コア数の小さい方
+    """
+    print("=" * 80)
+    print("3要素の群別分析")
+    print("=" * 80)
+
+    # 要素リスト
+    elements = [
+        ('Element1_Obligation', '要素1: コミュニケーション続行義務意識'),
+        ('Element2_Burden', '要素2: 対人配慮負担'),
+        ('Element3_Rejection', '要素3: 拒絶・評価懸念')
+    ]
+
+    # 出力フォルダ作成
+    os.makedirs('element_analysis', exist_ok=True)
+
+    results_summary = []
+
+    # 全要素の群分け (データ不足を除外) を先に行い、
+    # Shapiro-Wilk / Levene 検定を全要素まとめて実行する
+    # (ΔSTAI-Sは float32 の配列1本を保持し、各群は判定コードの位置で取り出す)
+    delta = df['Delta_STAI'].to_numpy(dtype=np.float32, copy=False)
+
+    element_codes  = {}  # {要素カラム: 判定コードの配列}
+    element_groups = {}  # {要素カラム: (群名のリスト, ΔSTAI-S配列のリスト)}
+    for col, _ in elements:
+        codes = df[col].cat.codes.to_numpy()
+        groups_data = []
+        group_names = []
+
+        for group in ['有効', '不変', '逆効果']:
+            idx = np.flatnonzero(codes == JUDGMENT_CODES[group])
+            if len(idx) > 0:
+                # 検定結果の精度を保つため、群ごとの配列は float64 で渡す
+                groups_data.append(delta[idx].astype(np.float64))
+                group_names.append(group)
+
+        element_codes[col]  = codes
+        element_groups[col] = (group_names, groups_data)
+
+    shapiro_keys = [(col, gname) for col, (names, _) in element_groups.items() for gname in names]
+    shapiro_results = dict(zip(shapiro_keys, shapiro_batch(
+        [data for _, (_, groups_data) in element_groups.items() for data in groups_data]
+    )))
+
+    levene_cols = [col for col, (_, groups_data) in element_groups.items()
+                   if len(groups_data) >= 2 and all(len(g) >= 2 for g in groups_data)]
+    levene_results = dict(zip(levene_cols, levene_batch(
+        [element_groups[col][1] for col in levene_cols]
+    )))
+
+    # 要素ごとの分析 (検定・図の保存) は互いに独立なので、別プロセスで並列に実行する
+    # (matplotlib はスレッドセーフではないためプロセスを使う)
+    args = [
+        (col, name, *element_groups[col],
+         {gname: shapiro_results[(col, gname)] for gname in element_groups[col][0]},
+         levene_results.get(col), delta, element_codes[col])
+        for col, name in elements
+    ]
+    if max_workers is None:
+        max_workers = min(len(elements), os.cpu_count() or 1)
+    if max_workers > 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as ex:
+            results = list(ex.map(analyze_one, *zip(*args)))
+    else:
+        results = [analyze_one(*a) for a in args]
+        _close_figure()
+
+    for report, summary in results:
+        print(report, end='')
+        if summary is not None:
+            results_summary.append(summary)
+
+    # ===================================
+    # サマリーテーブル作成
+    # ===================================
+    print("\n" + "=" * 80)
+    print("分析結果サマリー")
+    print("=" * 80)
+
+    summary_df = pd.DataFrame(results_summary, columns=SUMMARY_COLUMNS)
+    print("\n", summary_df.to_string(index=False))
+
+    # CSV保存
+    summary_df.to_csv('element_analysis/analysis_summary.csv', index=False, encoding='utf-8-sig',
+                      lineterminator='\n')
+    print("\n✓ サマリーをCSVで保存: element_analysis/analysis_summary.csv")
+
+    print("\n" + "=" * 80)
+    print("✅ 分析完了!")
+    print("=" * 80)
+    print("\n保存先: element_analysis/ フォルダ")
+    print("  - element1_group_comparison.png")
+    print("  - element2_group_comparison.png")
+    print("  - element3_group_comparison.png")
+    print("  - analysis_summary.csv")
+    print("=" * 80)
+
+
+if __name__ == '__main__':
+    analyze_elements_groups(load_data())
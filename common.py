@@ -0,0 +1,171 @@
+"""
+common.py
+各分析スクリプトで共通して使う補助関数
+
+    - load_data():               参加者データの読み込み (Parquetスナップショット経由)
+    - to_score():                判定カテゴリの数値化 (逆効果=-1, 不変=0, 有効=1)
+    - calc_eta_squared():        効果量 η² の算出
+    - permutation_eta_squared(): η² の並べ替え検定
+    - shapiro_batch():           複数群の Shapiro-Wilk 検定をまとめて実行 (結果はキャッシュ)
+    - levene_batch():            複数要素の Levene 検定をまとめて実行
+
+初回実行時に element_judgment_29participants_complete.csv から
+型付きの Parquet ファイルを作成し、以降はそちらを読み込む。
+CSVが更新された場合は Parquet を作り直す。
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from stats_cache import shapiro_cached
+
+
+# ============================================================
+# 設定
+# ============================================================
+CSV_FILE     = 'element_judgment_29participants_complete.csv'
+PARQUET_FILE = 'element_judgment_29participants_complete.parquet'
+
+# 判定カラムは固定カテゴリのカテゴリ型、STAI-Sスコアは float32 で保持する
+# カテゴリの並び順は数値化 (コード − 1 = 逆効果:-1, 不変:0, 有効:1) に合わせている
+JUDGMENT_DTYPE = pd.CategoricalDtype(['逆効果', '不変', '有効', 'データ不足'], ordered=True)
+JUDGMENT_CODES = {label: code for code, label in enumerate(JUDGMENT_DTYPE.categories)}
+MISSING_CODE   = JUDGMENT_CODES['データ不足']
+
+# 各群の n がこの値以上なら、順位検定は正確法でなく正規近似で p 値を求める
+ASYMPTOTIC_MIN_N = 20
+
+JUDGMENT_COLUMNS = ['Element1_Obligation', 'Element2_Burden', 'Element3_Rejection']
+
+DTYPES = {
+    'Element1_Obligation': JUDGMENT_DTYPE,
+    'Element2_Burden':     JUDGMENT_DTYPE,
+    'Element3_Rejection':  JUDGMENT_DTYPE,
+    'A_Score':             'float32',
+    'B_Score':             'float32',
+}
+
+
+# ============================================================
+# データ読み込み
+# ============================================================
+def load_data():
+    """参加者データを DataFrame として読み込む
+
+    Parquet が存在しない、または CSV より古い場合は CSV から作成し直す。
+    ΔSTAI-S (B条件スコア − A条件スコア) もここで1回だけ算出する。
+    """
+    if (not os.path.exists(PARQUET_FILE)
+            or os.path.getmtime(PARQUET_FILE) < os.path.getmtime(CSV_FILE)):
+        # 判定カラムはまずラベルをそのままカテゴリ化し、想定外のラベルが
+        # 固定カテゴリへの変換で黙って NaN にならないことを確認してから変換する
+        df = pd.read_csv(CSV_FILE, dtype={**DTYPES, **{col: 'category' for col in JUDGMENT_COLUMNS}})
+        for col in JUDGMENT_COLUMNS:
+            unknown = set(df[col].cat.categories) - set(JUDGMENT_DTYPE.categories)
+            if unknown:
+                raise ValueError(f"{col} に想定外の判定ラベルがあります: {sorted(unknown)}")
+        df = df.astype(DTYPES)
+        df.to_parquet(PARQUET_FILE, compression='zstd', index=False)
+
+    # カテゴリ定義が変わっても古いスナップショットと食い違わないよう型を揃える
+    df = pd.read_parquet(PARQUET_FILE).astype(DTYPES)
+    df['Delta_STAI'] = (df['B_Score'] - df['A_Score']).astype('float32')
+    return df
+
+
+def to_score(judgment):
+    """判定カテゴリの Series を数値スコア (逆効果=-1, 不変=0, 有効=1) に変換する
+
+    データ不足・欠損は NaN とする。
+    """
+    codes = judgment.cat.codes.to_numpy()
+    score = np.where((codes < 0) | (codes == MISSING_CODE),
+                     np.nan, codes.astype('float32') - 1)
+    return pd.Series(score.astype('float32'), index=judgment.index)
+
+
+# ============================================================
+# 効果量
+# ============================================================
+def calc_eta_squared(delta, codes):
+    """η²（イータ二乗）を計算する
+
+    η² = SS_between / SS_total
+      SS_between: 群間平方和 = Σ n_i × (群平均_i − 全体平均)²
+      SS_total:   全体平方和 = Σ (個別値 − 全体平均)²
+
+    「全体の変動のうち、群の違いによって説明できる割合」を表す。
+    delta は各参加者のΔSTAI-S、codes はその参加者の群コード（同じ長さ）。
+    """
+    k = len(JUDGMENT_CODES)
+    n = np.bincount(codes, minlength=k)
+    s = np.bincount(codes, weights=delta, minlength=k)
+    if n.sum() == 0:
+        return 0.0
+    means      = np.divide(s, n, out=np.zeros(k), where=n > 0)
+    grand_mean = s.sum() / n.sum()
+
+    ss_between = np.sum(n * (means - grand_mean) ** 2)
+    ss_total   = np.sum((delta - grand_mean) ** 2)
+
+    return ss_between / ss_total if ss_total > 0 else 0.0
+
+
+def permutation_eta_squared(delta, codes, n_resamples=9999, seed=None):
+    """η² の並べ替え検定を行う
+
+    群コードを無作為に並べ替えて η² の帰無分布を作り、観測値以上となる割合から
+    p 値 = (該当数 + 1) / (n_resamples + 1) を求める。
+    codes は分析対象の群コードのみとする (データ不足・欠損は呼び出し側で除外)。
+    numba があれば η² の繰り返し計算に stats_kernels.eta_sq を使う。
+    返り値は (観測された η², p 値)。
+    """
+    delta = np.ascontiguousarray(delta, dtype=np.float64)
+    codes = np.ascontiguousarray(codes)
+    k = len(JUDGMENT_CODES)
+    observed = calc_eta_squared(delta, codes)
+
+    try:
+        from stats_kernels import eta_sq as eta_sq_kernel
+    except ImportError:
+        eta_sq_kernel = None
+
+    if eta_sq_kernel is not None:
+        # コンパイル済みカーネルが NumPy 版と同じ値を返すことを観測データで確かめる
+        if not np.isclose(eta_sq_kernel(delta, codes, k), observed):
+            raise RuntimeError("stats_kernels.eta_sq の結果が calc_eta_squared と一致しません")
+        eta_sq = lambda c: eta_sq_kernel(delta, c, k)
+    else:
+        eta_sq = lambda c: calc_eta_squared(delta, c)
+
+    rng  = np.random.default_rng(seed)
+    null = np.array([eta_sq(rng.permutation(codes)) for _ in range(n_resamples)])
+    # 浮動小数点の誤差で観測値と同じ並べ方を取りこぼさないよう、わずかに許容幅を持たせる
+    n_extreme = np.count_nonzero(null >= observed - 1e-12)
+    return observed, (n_extreme + 1) / (n_resamples + 1)
+
+
+# ============================================================
+# 検定のまとめ実行
+# ============================================================
+def shapiro_batch(arrays):
+    """各配列に対する Shapiro-Wilk 検定をまとめて行う
+
+    1群ずつ stats_cache.shapiro_cached で検定するため、同じ群を別の分析で
+    検定した場合はキャッシュの結果を返す。
+    返り値は (W, p) のリスト (arrays と同じ順)。n < 3 の配列は (nan, nan)。
+    """
+    return [tuple(shapiro_cached(a)) if len(a) >= 3 else (np.nan, np.nan)
+            for a in arrays]
+
+
+def levene_batch(rows):
+    """要素ごとの群配列のリストに対して Levene 検定をまとめて行う
+
+    rows: [[群1の配列, 群2の配列, ...], ...]  (1要素につき1行)
+    返り値は (F, p) のリスト (rows と同じ順)。
+    """
+    return [tuple(stats.levene(*row)) for row in rows]
@@ -17,16 +17,16 @@ composite_analysis.py
     - LaTeX記載用のまとめ行
 """
 
-import pandas as pd
 import numpy as np
 from scipy import stats
 
+from common import (load_data, calc_eta_squared, shapiro_batch,
+                    ASYMPTOTIC_MIN_N, JUDGMENT_CODES, MISSING_CODE)
+
 
 # ============================================================
 # 設定
 # ============================================================
-CSV_FILE = 'element_judgment_29participants_complete.csv'
-
 ELEMENTS = [
     ('Element1_Obligation', '要素1: コミュニケーション続行義務意識'),
     ('Element2_Burden',     '要素2: 対人配慮負担'),
@@ -58,164 +58,171 @@ def format_p_latex(p_value):
         return f'p = .{int(rounded * 1000):03d}'
 
 
-def calc_eta_squared(group_arrays):
-    """η²（イータ二乗）を計算する
-
-    η² = SS_between / SS_total
-      SS_between: 群間平方和 = Σ n_i × (群平均_i − 全体平均)²
-      SS_total:   全体平方和 = Σ (個別値 − 全体平均)²
-
-    「全体の変動のうち、群の違いによって説明できる割合」を表す。
-    """
-    all_data   = np.concatenate(group_arrays)
-    grand_mean = np.mean(all_data)
-
-    ss_between = sum(
-        len(g) * (np.mean(g) - grand_mean) ** 2
-        for g in group_arrays
-    )
-    ss_total = np.sum((all_data - grand_mean) ** 2)
-
-    return ss_between / ss_total if ss_total > 0 else 0.0
-
-
-# ============================================================
-# データ読み込み
-# ============================================================
-df = pd.read_csv(CSV_FILE)
-print(f"読み込みデータ: {len(df)} 人")
-
-
-# ============================================================
-# ステップ1: ΔSTAI-Sの算出
-#
-# 定義: ΔSTAI-S = B条件スコア − A条件スコア
-#   正の値 → A条件（メッセージマッチング有）で不安が低かった
-#   負の値 → B条件（メッセージマッチング無）で不安が低かった
-# ============================================================
-df['Delta_STAI'] = df['B_Score'] - df['A_Score']
-
-print("\n" + "=" * 70)
-print(" ステップ1: ΔSTAI-S の算出 (B条件 − A条件)")
-print("=" * 70)
-print(f"  全体平均: {df['Delta_STAI'].mean():+.2f} (SD = {df['Delta_STAI'].std():.2f})\n")
-
-
 # ============================================================
-# ステップ2〜4: 各要素について群間比較を実行
+# 分析本体
 # ============================================================
-for col, name in ELEMENTS:
-    print("=" * 70)
-    print(f" {name}")
-    print("=" * 70)
+def composite_analysis(df):
+    """3要素の判定群ごとにΔSTAI-Sを比較し、検定結果と効果量を表示する"""
+    print(f"読み込みデータ: {len(df)} 人")
 
     # ---------------------------------------------------------
-    # ステップ2: データ不足を除外し、判定群に分類
+    # ステップ1: ΔSTAI-Sの算出
+    #
+    # 定義: ΔSTAI-S = B条件スコア − A条件スコア
+    #   正の値 → A条件（メッセージマッチング有）で不安が低かった
+    #   負の値 → B条件（メッセージマッチング無）で不安が低かった
+    # (算出自体は読み込み時に load_data() で行っている)
     # ---------------------------------------------------------
-    df_elem   = df[df[col] != 'データ不足'].copy()
-    n_excluded = len(df) - len(df_elem)
-
-    print(f"\n【ステップ2: 群分類】")
-    print(f"  データ不足で除外: {n_excluded} 人  →  分析対象: {len(df_elem)} 人\n")
-
-    groups = {}  # {判定ラベル: ΔSTAI-Sの配列}
-    for label in JUDGMENT_LABELS:
-        subset = df_elem[df_elem[col] == label]
-        if len(subset) > 0:
-            groups[label] = subset['Delta_STAI'].values
-            print(f"  {label}群: n={len(subset):2d} | "
-                  f"平均={subset['Delta_STAI'].mean():+6.2f} | "
-                  f"SD={subset['Delta_STAI'].std():5.2f} | "
-                  f"中央値={subset['Delta_STAI'].median():+5.1f} | "
-                  f"範囲=[{subset['Delta_STAI'].min():+3.0f}, "
-                  f"{subset['Delta_STAI'].max():+3.0f}]")
-
-    group_names  = list(groups.keys())
-    group_arrays = list(groups.values())
-    n_groups     = len(groups)
+    print("\n" + "=" * 70)
+    print(" ステップ1: ΔSTAI-S の算出 (B条件 − A条件)")
+    print("=" * 70)
+    print(f"  全体平均: {df['Delta_STAI'].mean():+.2f} (SD = {df['Delta_STAI'].std():.2f})\n")
+
+    delta = df['Delta_STAI'].to_numpy(dtype=np.float32, copy=False)
+
+    # 全要素・全群分まとめて先に行う (結果は stats_cache で他の分析と共有される)
+    # 全要素・全群まとめて1回で実行する
+    element_codes  = {}  # {要素カラム: 判定コードの配列}
+    element_groups = {}  # {要素カラム: {判定ラベル: ΔSTAI-Sの配列}}
+    for col, _ in ELEMENTS:
+        codes = df[col].cat.codes.to_numpy()
+        element_codes[col]  = codes
+        element_groups[col] = {}
+        for label in JUDGMENT_LABELS:
+            # 検定結果の精度を保つため、群ごとの配列は float64 で渡す
+            gdata = delta[np.flatnonzero(codes == JUDGMENT_CODES[label])].astype(np.float64)
+            if len(gdata) > 0:
+                element_groups[col][label] = gdata
+
+    shapiro_keys    = [(col, label) for col, groups in element_groups.items() for label in groups]
+    shapiro_results = dict(zip(shapiro_keys, shapiro_batch(
+        [element_groups[col][label] for col, label in shapiro_keys]
+    )))
 
     # ---------------------------------------------------------
-    # ステップ3: 正規性検定 (Shapiro-Wilk)
-    #
-    # 各群のΔSTAI-Sが正規分布に従うか確認する。
-    # n < 3 の群は検定実行不可なため、非正規として扱う。
-    # この結果がステップ4の検定手法選択に使われる。
+    # ステップ2〜4: 各要素について群間比較を実行
     # ---------------------------------------------------------
-    print(f"\n【ステップ3: 正規性検定 (Shapiro-Wilk)】")
-
-    all_normal = True
-    for gname, gdata in groups.items():
-        if len(gdata) >= 3:
-            w, p   = stats.shapiro(gdata)
-            is_normal = (p >= 0.05)
-            if not is_normal:
+    for col, name in ELEMENTS:
+        print("=" * 70)
+        print(f" {name}")
+        print("=" * 70)
+
+        # ---------------------------------------------------------
+        # ステップ2: データ不足を除外し、判定群に分類
+        # ---------------------------------------------------------
+        codes      = element_codes[col]
+        keep       = (codes >= 0) & (codes != MISSING_CODE)  # 判定の欠損 (コード -1) も除外
+        n_excluded = len(df) - keep.sum()
+
+        print(f"\n【ステップ2: 群分類】")
+        print(f"  データ不足で除外: {n_excluded} 人  →  分析対象: {keep.sum()} 人\n")
+
+        # 群別の記述統計を1回のgroupbyでまとめて算出
+        # (行を絞り込んだコピーは作らず、データ不足群の行は参照しないだけにする)
+        desc = (df.groupby(col, observed=True)['Delta_STAI']
+                  .agg(['count', 'mean', 'std', 'median', 'min', 'max']))
+
+        groups = element_groups[col]  # {判定ラベル: ΔSTAI-Sの配列}
+        for label in groups:
+            row = desc.loc[label]
+            print(f"  {label}群: n={int(row['count']):2d} | "
+                  f"平均={row['mean']:+6.2f} | "
+                  f"SD={row['std']:5.2f} | "
+                  f"中央値={row['median']:+5.1f} | "
+                  f"範囲=[{row['min']:+3.0f}, "
+                  f"{row['max']:+3.0f}]")
+
+        group_names  = list(groups.keys())
+        group_arrays = list(groups.values())
+        n_groups     = len(groups)
+
+        # ---------------------------------------------------------
+        # ステップ3: 正規性検定 (Shapiro-Wilk)
+        #
+        # 各群のΔSTAI-Sが正規分布に従うか確認する。
+        # n < 3 の群は検定実行不可なため、非正規として扱う。
+        # この結果がステップ4の検定手法選択に使われる。
+        # ---------------------------------------------------------
+        print(f"\n【ステップ3: 正規性検定 (Shapiro-Wilk)】")
+
+        all_normal = True
+        for gname, gdata in groups.items():
+            if len(gdata) >= 3:
+                w, p   = shapiro_results[(col, gname)]
+                is_normal = (p >= 0.05)
+                if not is_normal:
+                    all_normal = False
+                mark = '正規  ✓' if is_normal else '非正規 ✗'
+                print(f"  {gname}群 (n={len(gdata):2d}): W={w:.4f}, p={p:.4f}  →  {mark}")
+            else:
                 all_normal = False
-            mark = '正規  ✓' if is_normal else '非正規 ✗'
-            print(f"  {gname}群 (n={len(gdata):2d}): W={w:.4f}, p={p:.4f}  →  {mark}")
-        else:
-            all_normal = False
-            print(f"  {gname}群 (n={len(gdata):2d}): n < 3 のため検定スキップ  →  非正規として扱う ✗")
+                print(f"  {gname}群 (n={len(gdata):2d}): n < 3 のため検定スキップ  →  非正規として扱う ✗")
+
+        # ---------------------------------------------------------
+        # ステップ4: 検定手法の選択と実行
+        #
+        # 選択基準:
+        #   3群の場合:
+        #     全群が正規  → ANOVA（一元配置分散分析）
+        #     一部が非正規 → Kruskal-Wallis検定（順位に基づくノンパラメトリック）
+        #   2群の場合:
+        #     全群が正規  → 対応なしt検定
+        #     一部が非正規 → Mann-Whitney U検定
+        # ---------------------------------------------------------
+        print(f"\n【ステップ4: 群間比較】")
+        print(f"  正規性の判定: {'全群が正規' if all_normal else '一部の群が非正規'}")
+
+        if n_groups == 3:
+            if all_normal:
+                f_stat, p_value = stats.f_oneway(*group_arrays)
+                df_between = n_groups - 1
+                df_within  = sum(len(g) for g in group_arrays) - n_groups
+                test_name  = 'ANOVA'
+                stat_str   = f'F({df_between}, {df_within}) = {f_stat:.3f}'
+            else:
+                h_stat, p_value = stats.kruskal(*group_arrays)
+                test_name = 'Kruskal-Wallis'
+                stat_str  = f'H = {h_stat:.3f}'
+
+        elif n_groups == 2:
+            if all_normal:
+                t_stat, p_value = stats.ttest_ind(*group_arrays)
+                df_t       = sum(len(g) for g in group_arrays) - 2
+                test_name  = 't検定'
+                stat_str   = f't({df_t}) = {t_stat:.3f}'
+            else:
+                large_n = min(len(g) for g in group_arrays) >= ASYMPTOTIC_MIN_N
+                u_stat, p_value = stats.mannwhitneyu(
+                    *group_arrays, alternative='two-sided',
+                    method='asymptotic' if large_n else 'auto'
+                )
+                test_name = 'Mann-Whitney U'
+                stat_str  = f'U = {u_stat:.3f}'
+
+        # 有意性判定
+        if   p_value < 0.001: sig = '***'
+        elif p_value < 0.01:  sig = '**'
+        elif p_value < 0.05:  sig = '*'
+        else:                 sig = 'n.s.'
+
+        print(f"  選択手法: {test_name} "
+              f"({'パラメトリック' if all_normal else 'ノンパラメトリック'})")
+        print(f"  検定結果: {stat_str}, {format_p_latex(p_value)}  {sig}")
+
+        # --- 効果量 η² ---
+        eta_sq    = calc_eta_squared(delta[keep], codes[keep])
+        eta_label = classify_eta_sq(eta_sq)
+        print(f"  効果量:   η² = {eta_sq:.3f} ({eta_label})")
+
+        # --- LaTeX記載用まとめ ---
+        print(f"\n  ┌─── LaTeX記載用 ──────────────────────────────────────┐")
+        print(f"  │  {test_name}: {stat_str}, {format_p_latex(p_value)}, η² = {eta_sq:.2f}  {sig}")
+        print(f"  └──────────────────────────────────────────────────────┘\n")
 
-    # ---------------------------------------------------------
-    # ステップ4: 検定手法の選択と実行
-    #
-    # 選択基準:
-    #   3群の場合:
-    #     全群が正規  → ANOVA（一元配置分散分析）
-    #     一部が非正規 → Kruskal-Wallis検定（順位に基づくノンパラメトリック）
-    #   2群の場合:
-    #     全群が正規  → 対応なしt検定
-    #     一部が非正規 → Mann-Whitney U検定
-    # ---------------------------------------------------------
-    print(f"\n【ステップ4: 群間比較】")
-    print(f"  正規性の判定: {'全群が正規' if all_normal else '一部の群が非正規'}")
-
-    if n_groups == 3:
-        if all_normal:
-            f_stat, p_value = stats.f_oneway(*group_arrays)
-            df_between = n_groups - 1
-            df_within  = sum(len(g) for g in group_arrays) - n_groups
-            test_name  = 'ANOVA'
-            stat_str   = f'F({df_between}, {df_within}) = {f_stat:.3f}'
-        else:
-            h_stat, p_value = stats.kruskal(*group_arrays)
-            test_name = 'Kruskal-Wallis'
-            stat_str  = f'H = {h_stat:.3f}'
-
-    elif n_groups == 2:
-        if all_normal:
-            t_stat, p_value = stats.ttest_ind(*group_arrays)
-            df_t       = sum(len(g) for g in group_arrays) - 2
-            test_name  = 't検定'
-            stat_str   = f't({df_t}) = {t_stat:.3f}'
-        else:
-            u_stat, p_value = stats.mannwhitneyu(
-                *group_arrays, alternative='two-sided'
-            )
-            test_name = 'Mann-Whitney U'
-            stat_str  = f'U = {u_stat:.3f}'
-
-    # 有意性判定
-    if   p_value < 0.001: sig = '***'
-    elif p_value < 0.01:  sig = '**'
-    elif p_value < 0.05:  sig = '*'
-    else:                 sig = 'n.s.'
-
-    print(f"  選択手法: {test_name} "
-          f"({'パラメトリック' if all_normal else 'ノンパラメトリック'})")
-    print(f"  検定結果: {stat_str}, {format_p_latex(p_value)}  {sig}")
-
-    # --- 効果量 η² ---
-    eta_sq    = calc_eta_squared(group_arrays)
-    eta_label = classify_eta_sq(eta_sq)
-    print(f"  効果量:   η² = {eta_sq:.3f} ({eta_label})")
-
-    # --- LaTeX記載用まとめ ---
-    print(f"\n  ┌─── LaTeX記載用 ──────────────────────────────────────┐")
-    print(f"  │  {test_name}: {stat_str}, {format_p_latex(p_value)}, η² = {eta_sq:.2f}  {sig}")
-    print(f"  └──────────────────────────────────────────────────────┘\n")
-
-
-print("=" * 70)
-print(" 分析完了")
-print("=" * 70)
\ No newline at end of file
+    print("=" * 70)
+    print(" 分析完了")
+    print("=" * 70)
+
+
+if __name__ == '__main__':
+    composite_analysis(load_data())
@@ -0,0 +1,23 @@
+"""
+run_all_analyses.py
+3つの分析 (STAI-S分析・複合分析・3要素の群別比較) をまとめて実行する
+
+実行方法:
+    python run_all_analyses.py
+
+データの読み込みとΔSTAI-Sの算出は1回だけ行い、各分析に同じ DataFrame を渡す。
+個別のスクリプトを単独で実行した場合と同じ結果が出力される。
+"""
+
+from common import load_data
+from stai_analysis import stai_analysis
+from composite_analysis import composite_analysis
+from Analyze_elements_groups import analyze_elements_groups
+
+
+if __name__ == '__main__':
+    df = load_data()
+
+    stai_analysis(df)
+    composite_analysis(df)
+    analyze_elements_groups(df)
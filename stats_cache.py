@@ -0,0 +1,26 @@
+"""
+stats_cache.py
+同じデータに対する統計検定の結果を使い回すためのキャッシュ
+
+    - shapiro_cached(): stats.shapiro の結果を配列の中身ごとにキャッシュする
+
+run_all_analyses.py で複数の分析を続けて実行すると、同じ判定群の
+ΔSTAI-Sに対して Shapiro-Wilk 検定が繰り返し行われるため、その重複を省く。
+"""
+
+import functools
+
+import numpy as np
+from scipy import stats
+
+
+@functools.lru_cache(maxsize=64)
+def _shapiro_from_bytes(arr_bytes):
+    """float64 配列のバイト列から Shapiro-Wilk 検定を行う (キャッシュ本体)"""
+    return stats.shapiro(np.frombuffer(arr_bytes, dtype=np.float64))
+
+
+def shapiro_cached(data):
+    """stats.shapiro と同じ結果を返す。値が同じ配列なら2回目以降は再計算しない"""
+    arr = np.ascontiguousarray(data, dtype=np.float64)
+    return _shapiro_from_bytes(arr.tobytes())
@@ -0,0 +1,55 @@
+"""
+stats_kernels.py
+Numba でコンパイルする統計量の計算カーネル (numba が必要)
+
+    - eta_sq(): 効果量 η² (common.calc_eta_squared と同じ値)
+
+並べ替え検定やブートストラップのように同じ計算を何千回も繰り返す場合向け。
+一時配列を作らず、群ごとの人数・合計と全体平方和をループ1本ずつで求める。
+numba の読み込みとコンパイルに時間がかかるため、1回だけの計算では
+common.calc_eta_squared を使い、このモジュールは
+common.permutation_eta_squared の中で必要になった時点で import する。
+"""
+
+import numpy as np
+from numba import njit
+
+
+@njit(fastmath=True, cache=True)
+def eta_sq(delta, codes, k):
+    """η²（イータ二乗）を計算する
+
+    delta: 各参加者のΔSTAI-S (1次元配列)
+    codes: 各参加者の群コード 0 〜 k-1 (delta と同じ長さの整数配列)
+    k:     群コードの種類数
+
+    範囲外のコード (欠損の -1 など) の参加者は計算に含めない。
+    """
+    n = np.zeros(k, dtype=np.int64)
+    s = np.zeros(k, dtype=np.float64)
+    for i in range(delta.shape[0]):
+        c = codes[i]
+        if c < 0 or c >= k:
+            continue
+        n[c] += 1
+        s[c] += delta[i]
+
+    n_total = n.sum()
+    if n_total == 0:
+        return 0.0
+    grand_mean = s.sum() / n_total
+
+    ss_total = 0.0
+    for i in range(delta.shape[0]):
+        if codes[i] < 0 or codes[i] >= k:
+            continue
+        d = delta[i] - grand_mean
+        ss_total += d * d
+
+    ss_between = 0.0
+    for j in range(k):
+        if n[j] > 0:
+            d = s[j] / n[j] - grand_mean
+            ss_between += n[j] * d * d
+
+    return ss_between / ss_total if ss_total > 0 else 0.0